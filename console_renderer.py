@@ -0,0 +1,120 @@
+import argparse
+import sys
+from colorama import Fore, Style
+from tabulate import tabulate
+
+DEFAULT_LIMIT = 50
+DEFAULT_PAGE_SIZE = 20
+MAX_VALUE_WIDTH = 80
+
+
+def _non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or greater, got {value}")
+    return number
+
+
+def _positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+
+def add_arguments(parser):
+    """Register the console output options on a script's argument parser."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--summary", action="store_true", help="Print a compact one-line-per-row table.")
+    group.add_argument("--quiet", action="store_true", help="Do not print per-row details.")
+    rows = parser.add_mutually_exclusive_group()
+    rows.add_argument("--limit", type=_non_negative_int, metavar="N",
+                      help=f"Print at most N rows (default {DEFAULT_LIMIT} unless --all or --page is given).")
+    rows.add_argument("--all", action="store_true", help="Print every row.")
+    parser.add_argument("--page", nargs="?", type=_positive_int, const=DEFAULT_PAGE_SIZE, metavar="ROWS",
+                        help=f"Page the output, ROWS per page (default {DEFAULT_PAGE_SIZE}).")
+
+
+def truncate(series, width):
+    """Flatten newlines and truncate a column in one vectorized pass."""
+    text = series.fillna("").astype(str).str.replace(r"[\r\n]+", " ", regex=True)
+    return text.where(text.str.len() <= width, text.str.slice(0, width) + "...")
+
+
+def _cards(df, columns, headers):
+    """Build one vertical block per row, column by column rather than row by row."""
+    label_width = max(len(col) for col in columns)
+    # Continuation lines of multi-line values are indented under the value column
+    continuation = "\n" + " " * (label_width + 2)
+    blocks = headers.astype(str)
+    for col in columns:
+        label = f"{Fore.GREEN}{(col + ':').ljust(label_width + 1)}{Style.RESET_ALL} "
+        values = df[col].fillna("").astype(str).str.replace(r"\r\n?", "\n", regex=True).str.rstrip()
+        blocks = blocks + "\n" + label + values.str.replace("\n", continuation, regex=False)
+    separator = f"{Fore.CYAN}{'-' * 60}{Style.RESET_ALL}\n"
+    return (separator + blocks).tolist()
+
+
+def _table(df, columns, width):
+    """Build a compact table, returning its header and its row lines."""
+    cleaned = {col: truncate(df[col], width) for col in columns}
+    lines = tabulate(cleaned, headers="keys", tablefmt="simple", showindex=False).splitlines()
+    return "\n".join(lines[:2]), lines[2:]
+
+
+def _write_paged(chunks, page_size, stream, header=None):
+    """Write chunks one page at a time, repeating the header on every page."""
+    for start in range(0, len(chunks), page_size):
+        page = chunks[start:start + page_size]
+        stream.write("\n".join([header] + page if header else page) + "\n")
+        stream.flush()
+        shown = start + len(page)
+        if shown < len(chunks):
+            answer = input(f"{Fore.YELLOW}-- More ({shown}/{len(chunks)}), Enter to continue, q to stop --{Style.RESET_ALL} ")
+            if answer.strip().lower() == "q":
+                break
+
+
+def render(df, columns, headers, title, options, width=MAX_VALUE_WIDTH, stream=None):
+    """Render rows to the console according to --summary/--quiet/--limit/--all/--page.
+
+    All text is formatted up front with vectorized column operations and
+    written with a single write call (one per page when paging). Unless
+    --page or --all is used, at most DEFAULT_LIMIT rows are shown, so display
+    time stays small however many rows were pulled. Values are truncated to
+    width only in the --summary table; cards show them in full.
+    """
+    if options.quiet or df.empty:
+        return
+    stream = stream or sys.stdout
+    paged = bool(options.page) and stream.isatty() and sys.stdin.isatty()
+    total = len(df)
+    limit = options.limit
+    # --page without a console to page in still means "show everything", like --all
+    if limit is None and not options.all and not options.page:
+        limit = DEFAULT_LIMIT
+    if limit is not None:
+        df = df.head(limit)
+        headers = headers.loc[df.index]
+
+    header = None
+    if options.summary:
+        header, chunks = _table(df, columns, width)
+    else:
+        chunks = _cards(df, columns, headers)
+    footer = []
+    if not options.summary:
+        footer.append(f"{Fore.CYAN}{'-' * 60}{Style.RESET_ALL}")
+    if len(df) < total:
+        footer.append(f"{Fore.YELLOW}... {total - len(df)} more rows not shown "
+                      f"(use --limit N, --all or --page to see more).{Style.RESET_ALL}")
+
+    title = f"\n{Fore.YELLOW}{title}{Style.RESET_ALL}"
+    if paged:
+        stream.write(title + "\n")
+        _write_paged(chunks, options.page, stream, header)
+        if footer:
+            stream.write("\n".join(footer) + "\n")
+    else:
+        stream.write("\n".join([title] + ([header] if header else []) + chunks + footer) + "\n")
+    stream.flush()
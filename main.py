@@ -8,12 +8,31 @@ load_dotenv()  # Loads variables from .env into environment
 
 EXCEL_PATH = os.getenv("EXCEL_PATH")
 
-def run_script(script_name):
+def run_script(script_name, script_args=None):
     try:
-        subprocess.run([sys.executable, script_name], check=True)
+        subprocess.run([sys.executable, script_name] + (script_args or []), check=True)
     except subprocess.CalledProcessError as e:
         print(f"{Fore.RED}❌ Failed to run {script_name}: {e}{Style.RESET_ALL}")
 
+def prompt_output_mode():
+    """Ask how the script should print rows and return the matching flags."""
+    print(f"\n{Fore.GREEN}Select console output:{Style.RESET_ALL}")
+    print("1. Details (first 50 rows)")
+    print("2. Summary table (first 50 rows)")
+    print("3. Paged (all rows, 20 per page)")
+    print("4. Quiet (totals only)")
+    mode_choice = input("Enter option (1-4): ").strip()
+    output_flags = {
+        "1": [],
+        "2": ["--summary"],
+        "3": ["--page"],
+        "4": ["--quiet"],
+    }
+    if mode_choice not in output_flags:
+        print(f"{Fore.RED}Invalid choice. Defaulting to 'Details'.{Style.RESET_ALL}")
+        mode_choice = "1"
+    return output_flags[mode_choice]
+
 def clear_console():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -32,10 +51,10 @@ def main():
         choice = input("Enter option (1-2 or q): ").strip()
 
         if choice == "1":
-            run_script("pull mr.py")
+            run_script("pull mr.py", prompt_output_mode())
             prompt_open_excel()
         elif choice == "2":
-            run_script("pull jira tickets.py")
+            run_script("pull jira tickets.py", prompt_output_mode())
             prompt_open_excel()
         elif choice.lower() == "q":
             print(f"{Fore.CYAN}Goodbye!{Style.RESET_ALL}")
@@ -1,12 +1,17 @@
+import argparse
+import json
 import requests
 import pandas as pd
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from colorama import Fore, Style
 import logging
 import os
-from tabulate import tabulate
 from dotenv import load_dotenv
 
+import console_renderer
+import raw_archive
+
 load_dotenv()  # Loads variables from .env into environment
 
 
@@ -37,6 +42,52 @@ def extract_description(desc):
     walk(desc)
     return "".join(result).strip()
 
+
+def load_worklog_cache(path):
+    """Load cached worklogs keyed by issue key, or an empty cache."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read worklog cache '{path}': {e}")
+        return {}
+
+
+def save_worklog_cache(path, cache):
+    """Write the worklog cache atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
+
+def fetch_worklogs(session, key):
+    """Fetch every worklog of an issue, following pagination."""
+    worklogs = []
+    start_at = 0
+    while True:
+        response = session.get(
+            f"{JIRA_URL}/rest/api/3/issue/{key}/worklog",
+            params={"startAt": start_at, "maxResults": 1000},
+            timeout=30
+        )
+        response.raise_for_status()
+        data = response.json()
+        page = data.get("worklogs", [])
+        worklogs.extend({
+            "id": w.get("id"),
+            "author": (w.get("author") or {}).get("displayName"),
+            "started": w.get("started"),
+            "seconds": w.get("timeSpentSeconds", 0),
+        } for w in page)
+        start_at += len(page)
+        if not page or start_at >= data.get("total", 0):
+            break
+    return worklogs
+
 # --- Logging Setup ---
 log_time = datetime.now().strftime("%Y-%m")
 log_filename = f"./logs/jira_ticket_log_{log_time}.log"
@@ -53,96 +104,154 @@ JIRA_USER = os.getenv("JIRA_USER")
 JIRA_API_TOKEN = os.getenv("JIRA_API_TOKEN")
 EXCEL_PATH = os.getenv("EXCEL_PATH")
 SHEET_NAME = "JIRA Tickets"
+ARCHIVE_SOURCE = "jira"
+WORKLOG_SHEET_NAME = "Time Logged"
+WORKLOG_CACHE_PATH = "./cache/jira_worklogs.json"
+try:
+    WORKLOG_WORKERS = max(1, int(os.getenv("WORKLOG_WORKERS") or 8))
+except ValueError:
+    WORKLOG_WORKERS = 8
 
-# --- User Options ---
-print(f"{Fore.GREEN}Select JIRA Ticket Scope:{Style.RESET_ALL}")
-print("1. All JIRA Tickets")
-print("2. Assigned To Me (Unresolved)")
-print("3. Assigned To Me (Resolved and Unresolved)")
-print("4. Watching (Tickets I Watch)")
-print("5. Was Assigned To Me")
-
-scope_choice = input("Enter option (1-5): ").strip()
-
-scope_map = {
-    "1": "",  # All
-    "2": "assignee=currentUser() AND resolution=Unresolved",
-    "3": "assignee=currentUser()",
-    "4": "watcher = currentUser()",
-    "5": "assignee WAS currentUser() AND assignee != currentUser()"
-}
-if scope_choice not in scope_map:
-    print(f"{Fore.RED}Invalid choice. Defaulting to 'Assigned to Me'.{Style.RESET_ALL}")
-    scope_choice = "2"
-
-# --- Date Filter Options ---
-print(f"{Fore.GREEN}\nSelect Date Filter:{Style.RESET_ALL}")
-print("a. All")
-print("b. Today")
-print("c. This Week")
-print("d. This Month")
-
-date_choice = input("Enter option (a-d): ").strip().lower()
-
-if date_choice not in ("a", "b", "c", "d"):
-    print(f"{Fore.RED}Invalid choice. Defaulting to 'All'.{Style.RESET_ALL}")
-    date_choice = "a"
-
-now = datetime.now()
-date_jql = ""
-if date_choice == "a":
-    date_jql = ""
-elif date_choice == "b":
-    today = now.strftime("%Y-%m-%d")
-    date_jql = f'AND updated >= "{today}"'
-elif date_choice == "c":
-    start_of_week = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
-    date_jql = f'AND updated >= "{start_of_week}"'
-elif date_choice == "d":
-    first_day = now.replace(day=1).strftime("%Y-%m-%d")
-    date_jql = f'AND updated >= "{first_day}"'
+# --- Command Line Options ---
+parser = argparse.ArgumentParser(description="Pull JIRA tickets into Excel.")
+parser.add_argument("--replay", nargs="?", const="all", metavar="RUN_ID",
+                    help="Re-run flatten/save from the raw archive without network calls. With no RUN_ID, uses the "
+                         "newest archived payload of every key; 'latest' or a RUN_ID replays a single run.")
+parser.add_argument("--list-runs", action="store_true", help="List archived runs and exit.")
+parser.add_argument("--skip-worklogs", action="store_true", help="Do not pull worklogs or update the 'Time Logged' sheet.")
+console_renderer.add_arguments(parser)
+args = parser.parse_args()
+
+if args.list_runs:
+    for run_id in raw_archive.list_runs(ARCHIVE_SOURCE):
+        print(run_id)
+    raise SystemExit(0)
+
+if args.replay:
+    # --- Replay Raw Pages from Archive ---
+    records_of = lambda page: page.get("issues", [])
+    key_of = lambda issue: issue.get("key")
+    try:
+        if args.replay == "all":
+            issues = raw_archive.load_latest_records(ARCHIVE_SOURCE, records_of, key_of)
+        else:
+            latest = raw_archive.latest_run_id(ARCHIVE_SOURCE)
+            run_id = latest if args.replay == "latest" else args.replay
+            issues = [record for page in raw_archive.load_run(ARCHIVE_SOURCE, run_id) for record in records_of(page)]
+            if run_id != latest:
+                # Saving keeps the last row per key, so an older run would overwrite newer sheet rows
+                print(f"{Fore.YELLOW}Run {run_id} is not the latest run ({latest}). "
+                      f"Its older data will overwrite newer rows in the sheet.{Style.RESET_ALL}")
+                if input("Continue anyway? (y/n): ").strip().lower() != "y":
+                    raise SystemExit(0)
+    except (FileNotFoundError, KeyError) as e:
+        print(f"{Fore.RED}Cannot replay: {e}{Style.RESET_ALL}")
+        raise SystemExit(1)
+    logging.info(f"Replayed {len(issues)} issues from archive run {args.replay}")
+    print(f"{Fore.YELLOW}Replaying {len(issues)} JIRA tickets from archive ({args.replay}).{Style.RESET_ALL}")
 else:
+    # --- User Options ---
+    print(f"{Fore.GREEN}Select JIRA Ticket Scope:{Style.RESET_ALL}")
+    print("1. All JIRA Tickets")
+    print("2. Assigned To Me (Unresolved)")
+    print("3. Assigned To Me (Resolved and Unresolved)")
+    print("4. Watching (Tickets I Watch)")
+    print("5. Was Assigned To Me")
+
+    scope_choice = input("Enter option (1-5): ").strip()
+
+    scope_map = {
+        "1": "",  # All
+        "2": "assignee=currentUser() AND resolution=Unresolved",
+        "3": "assignee=currentUser()",
+        "4": "watcher = currentUser()",
+        "5": "assignee WAS currentUser() AND assignee != currentUser()"
+    }
+    if scope_choice not in scope_map:
+        print(f"{Fore.RED}Invalid choice. Defaulting to 'Assigned to Me'.{Style.RESET_ALL}")
+        scope_choice = "2"
+
+    # --- Date Filter Options ---
+    print(f"{Fore.GREEN}\nSelect Date Filter:{Style.RESET_ALL}")
+    print("a. All")
+    print("b. Today")
+    print("c. This Week")
+    print("d. This Month")
+
+    date_choice = input("Enter option (a-d): ").strip().lower()
+
+    if date_choice not in ("a", "b", "c", "d"):
+        print(f"{Fore.RED}Invalid choice. Defaulting to 'All'.{Style.RESET_ALL}")
+        date_choice = "a"
+
+    now = datetime.now()
     date_jql = ""
+    if date_choice == "a":
+        date_jql = ""
+    elif date_choice == "b":
+        today = now.strftime("%Y-%m-%d")
+        date_jql = f'AND updated >= "{today}"'
+    elif date_choice == "c":
+        start_of_week = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+        date_jql = f'AND updated >= "{start_of_week}"'
+    elif date_choice == "d":
+        first_day = now.replace(day=1).strftime("%Y-%m-%d")
+        date_jql = f'AND updated >= "{first_day}"'
+    else:
+        date_jql = ""
 
-base_jql = scope_map[scope_choice]
-if base_jql and date_jql:
-    JIRA_JQL = f"{base_jql} {date_jql} ORDER BY updated DESC"
-elif base_jql:
-    JIRA_JQL = f"{base_jql} ORDER BY updated DESC"
-else:
-    JIRA_JQL = f"ORDER BY updated DESC"
-print(f"{Fore.YELLOW}\nJQL: {JIRA_JQL}{Style.RESET_ALL}")
+    base_jql = scope_map[scope_choice]
+    if base_jql and date_jql:
+        JIRA_JQL = f"{base_jql} {date_jql} ORDER BY updated DESC"
+    elif base_jql:
+        JIRA_JQL = f"{base_jql} ORDER BY updated DESC"
+    else:
+        JIRA_JQL = f"ORDER BY updated DESC"
+    print(f"{Fore.YELLOW}\nJQL: {JIRA_JQL}{Style.RESET_ALL}")
 
-# --- Fetch JIRA Issues with Pagination and Error Handling ---
-headers = {"Accept": "application/json"}
-auth = (JIRA_USER, JIRA_API_TOKEN)
-max_results = 100
-start_at = 0
-issues = []
+    # --- Fetch JIRA Issues with Pagination and Error Handling ---
+    headers = {"Accept": "application/json"}
+    auth = (JIRA_USER, JIRA_API_TOKEN)
+    max_results = 100
+    start_at = 0
+    pages = []
+    issues = []
 
-try:
-    while True:
-        params = {
-            "jql": JIRA_JQL,
-            "maxResults": max_results,
-            "startAt": start_at
-        }
-        try:
-            response = requests.get(f"{JIRA_URL}/rest/api/3/search", headers=headers, params=params, auth=auth, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            issues.extend(data.get("issues", []))
-            logging.info(f"Fetched {len(data.get('issues', []))} issues (startAt={start_at})")
-            if start_at + max_results >= data.get("total", 0):
+    try:
+        while True:
+            params = {
+                "jql": JIRA_JQL,
+                "maxResults": max_results,
+                "startAt": start_at
+            }
+            try:
+                response = requests.get(f"{JIRA_URL}/rest/api/3/search", headers=headers, params=params, auth=auth, timeout=30)
+                response.raise_for_status()
+                data = response.json()
+                pages.append(data)
+                issues.extend(data.get("issues", []))
+                logging.info(f"Fetched {len(data.get('issues', []))} issues (startAt={start_at})")
+                if start_at + max_results >= data.get("total", 0):
+                    break
+                start_at += max_results
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Error fetching JIRA issues: {e}")
+                print(f"{Fore.RED}Error fetching JIRA issues: {e}{Style.RESET_ALL}")
                 break
-            start_at += max_results
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching JIRA issues: {e}")
-            print(f"{Fore.RED}Error fetching JIRA issues: {e}{Style.RESET_ALL}")
-            break
-except Exception as e:
-    logging.error(f"Unexpected error during JIRA fetch: {e}")
-    print(f"{Fore.RED}Unexpected error: {e}{Style.RESET_ALL}")
+    except Exception as e:
+        logging.error(f"Unexpected error during JIRA fetch: {e}")
+        print(f"{Fore.RED}Unexpected error: {e}{Style.RESET_ALL}")
+
+    # --- Archive Raw Pages ---
+    try:
+        raw_archive.append_run(
+            ARCHIVE_SOURCE, raw_archive.new_run_id(), pages,
+            records_of=lambda page: page.get("issues", []),
+            key_of=lambda issue: issue.get("key"),
+            meta={"jql": JIRA_JQL},
+        )
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not archive raw JIRA pages: {e}")
 
 # --- Flatten Data ---
 flat_data = []
@@ -165,6 +274,7 @@ for issue in issues:
         "Created": fields.get("created"),
         "Updated": fields.get("updated"),
         "Due Date": fields.get("duedate"),
+        "Time Spent (h)": round((fields.get("timespent") or 0) / 3600, 2),
         "Logged At": timestamp
     })
 
@@ -197,31 +307,97 @@ if flat_data:
         print(f"{Fore.CYAN}📁 Saved to: {EXCEL_PATH}{Style.RESET_ALL}")
         logging.info(f"Saved {len(combined_df)} unique tickets to Excel.")
 
-        # --- Show vertical table summary in console ---
-        def truncate(text, length=40):
-            if pd.isna(text):
-                return ""
-            text = str(text).replace('\n', ' ').replace('\r', ' ')
-            return text[:length] + ("..." if len(text) > length else "")
-
+        # --- Show ticket summary in console ---
         summary_df = new_df.copy()
-        summary_df["Summary"] = summary_df["Summary"]
-        summary_df["Description"] = summary_df["Description"].apply(lambda x: truncate(x, 60))
+        summary_df["Description"] = console_renderer.truncate(summary_df["Description"], 60)
         summary_df["Updated"] = pd.to_datetime(summary_df["Updated"]).dt.strftime('%Y-%m-%d %H:%M')
 
         display_cols = ["Key", "Project", "Summary", "Description", "Status", "Assignee", "Due Date", "Updated"]
-
-        print(f"\n{Fore.YELLOW}JIRA Ticket Summary:{Style.RESET_ALL}")
-        for idx, row in summary_df[display_cols].iterrows():
-            print(f"{Fore.CYAN}{'-'*40}{Style.RESET_ALL}")
-            print(f"{Fore.BLUE}Ticket {idx + 1}:{Style.RESET_ALL}")
-            for col in display_cols:
-                print(f"{Fore.GREEN}{col}:{Style.RESET_ALL} {row[col]}")
-        print(f"{Fore.CYAN}{'-'*40}{Style.RESET_ALL}")
+        if args.summary:
+            display_cols = ["Key", "Status", "Assignee", "Summary", "Updated"]
+        ticket_headers = f"{Fore.BLUE}Ticket " + pd.Series(range(1, len(summary_df) + 1), index=summary_df.index).astype(str) + f":{Style.RESET_ALL}"
+        console_renderer.render(summary_df, display_cols, ticket_headers, "JIRA Ticket Summary:", args, width=60)
 
     except Exception as e:
         logging.error(f"Error saving to Excel: {e}")
         print(f"{Fore.RED}Error saving to Excel: {e}{Style.RESET_ALL}")
 else:
     print(f"{Fore.YELLOW}No JIRA tickets found.{Style.RESET_ALL}")
-    logging.info("No JIRA tickets found.")
\ No newline at end of file
+    logging.info("No JIRA tickets found.")
+
+# --- Worklog Stage: Pull Worklogs for Changed Issues Only ---
+if issues and not args.skip_worklogs:
+    worklog_cache = load_worklog_cache(WORKLOG_CACHE_PATH)
+    stale = [
+        issue for issue in issues
+        if worklog_cache.get(issue["key"], {}).get("updated") != issue["fields"].get("updated")
+    ]
+    logging.info(f"Worklogs: {len(stale)} changed issues, {len(issues) - len(stale)} served from cache.")
+
+    if stale and args.replay:
+        print(f"{Fore.YELLOW}Replay mode: skipping worklog fetch for {len(stale)} changed issues.{Style.RESET_ALL}")
+    elif stale:
+        print(f"{Fore.YELLOW}Fetching worklogs for {len(stale)} changed issues...{Style.RESET_ALL}")
+        failed = 0
+        with requests.Session() as session:
+            session.auth = (JIRA_USER, JIRA_API_TOKEN)
+            session.headers.update({"Accept": "application/json"})
+            adapter = requests.adapters.HTTPAdapter(pool_connections=WORKLOG_WORKERS, pool_maxsize=WORKLOG_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            with ThreadPoolExecutor(max_workers=WORKLOG_WORKERS) as pool:
+                futures = {pool.submit(fetch_worklogs, session, issue["key"]): issue for issue in stale}
+                for future in as_completed(futures):
+                    issue = futures[future]
+                    try:
+                        worklogs = future.result()
+                    except Exception as e:
+                        # One bad issue must not lose the rest; leave its cache entry stale so it is retried next run
+                        failed += 1
+                        logging.error(f"Error fetching worklogs for {issue['key']}: {e}")
+                        continue
+                    worklog_cache[issue["key"]] = {
+                        "updated": issue["fields"].get("updated"),
+                        "summary": issue["fields"].get("summary"),
+                        "worklogs": worklogs,
+                    }
+        if failed:
+            print(f"{Fore.RED}Could not fetch worklogs for {failed} issues. See log for details.{Style.RESET_ALL}")
+        try:
+            save_worklog_cache(WORKLOG_CACHE_PATH, worklog_cache)
+        except OSError as e:
+            logging.warning(f"Could not save worklog cache: {e}")
+
+    # --- Aggregate Time Logged per Day ---
+    worklog_rows = [
+        {
+            "Date": (w.get("started") or "")[:10],
+            "Key": key,
+            "Summary": entry.get("summary"),
+            "Author": w.get("author"),
+            "Seconds": w.get("seconds") or 0,
+        }
+        for key, entry in worklog_cache.items()
+        for w in entry.get("worklogs", [])
+    ]
+    if worklog_rows:
+        try:
+            time_df = (
+                pd.DataFrame(worklog_rows)
+                .groupby(["Date", "Key", "Summary", "Author"], as_index=False, dropna=False)
+                .agg(Seconds=("Seconds", "sum"), Entries=("Seconds", "size"))
+            )
+            time_df["Hours"] = (time_df["Seconds"] / 3600).round(2)
+            time_df = time_df.drop(columns="Seconds").sort_values(["Date", "Key"], ascending=[False, True])
+
+            writer_mode = {"mode": "a", "if_sheet_exists": "replace"} if os.path.exists(EXCEL_PATH) else {"mode": "w"}
+            with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", **writer_mode) as writer:
+                time_df.to_excel(writer, sheet_name=WORKLOG_SHEET_NAME, index=False)
+            print(f"{Fore.GREEN}✅ Synced {len(time_df)} daily time entries to '{WORKLOG_SHEET_NAME}' sheet.{Style.RESET_ALL}")
+            logging.info(f"Saved {len(time_df)} daily time entries to '{WORKLOG_SHEET_NAME}' sheet.")
+        except Exception as e:
+            logging.error(f"Error saving worklogs to Excel: {e}")
+            print(f"{Fore.RED}Error saving worklogs to Excel: {e}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.YELLOW}No worklogs found.{Style.RESET_ALL}")
+        logging.info("No worklogs found.")
@@ -1,14 +1,19 @@
+import argparse
+import json
 import requests
 import pandas as pd
 from openpyxl import load_workbook
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 import logging
 from colorama import init, Fore, Style
-from tabulate import tabulate
 from dotenv import load_dotenv
 import math
 
+import console_renderer
+import raw_archive
+
 load_dotenv()  # Loads variables from .env into environment
 
 init(autoreset=True)
@@ -31,69 +36,248 @@ ACCESS_TOKEN = os.getenv("GITLAB_ACCESS_TOKEN")
 API_URL = "https://gitlab.com/api/v4/merge_requests?scope=created_by_me&per_page=100"
 EXCEL_PATH = os.getenv("EXCEL_PATH")
 SHEET_NAME = "Merge Requests"
+ARCHIVE_SOURCE = "gitlab_mr"
+GITLAB_API = "https://gitlab.com/api/v4"
+ENRICH_CACHE_PATH = "./cache/gitlab_mr_enrichment.json"
+try:
+    ENRICH_WORKERS = max(1, int(os.getenv("ENRICH_WORKERS") or 8))
+except ValueError:
+    ENRICH_WORKERS = 8
+
+# --- Command Line Options ---
+parser = argparse.ArgumentParser(description="Pull GitLab merge requests into Excel.")
+parser.add_argument("--replay", nargs="?", const="all", metavar="RUN_ID",
+                    help="Re-run flatten/save from the raw archive without network calls. With no RUN_ID, uses the "
+                         "newest archived payload of every key; 'latest' or a RUN_ID replays a single run.")
+parser.add_argument("--list-runs", action="store_true", help="List archived runs and exit.")
+parser.add_argument("--skip-enrichment", action="store_true", help="Do not fetch per-MR commit and diff stats.")
+console_renderer.add_arguments(parser)
+args = parser.parse_args()
+
+if args.list_runs:
+    for run_id in raw_archive.list_runs(ARCHIVE_SOURCE):
+        print(run_id)
+    exit()
 
-# --- Ask user for filter option ---
-print(f"{Fore.GREEN}Select Merge Request filter:{Style.RESET_ALL}")
-print("1. All Merge Requests")
-print("2. Only Open")
-print("3. This Month")
-print("4. This Week")
-print("5. Today")
-choice = input("Enter option (1-5): ").strip()
-
-print(f"{Fore.YELLOW}\n🔧 Selected filter: {choice}\n{Style.RESET_ALL}")
-
-# Validate choice
-if choice not in ["1", "2", "3", "4", "5"]:
-    print(f"{Fore.RED}\n❌ Invalid choice. Defaulting to 'Only Open'.\n{Style.RESET_ALL}")
-    choice = "2"
-
-base_url = "https://gitlab.com/api/v4/merge_requests?scope=created_by_me&per_page=100"
-now = datetime.now()
-if choice == "2":
-    API_URL = base_url + "&state=opened"
-elif choice == "3":
-    first_day = now.replace(day=1).strftime("%Y-%m-%dT00:00:00Z")
-    API_URL = base_url + f"&created_after={first_day}"
-elif choice == "4":
-    start_of_week = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%dT00:00:00Z")
-    API_URL = base_url + f"&created_after={start_of_week}"
-elif choice == "5":
-    today = now.strftime("%Y-%m-%dT00:00:00Z")
-    API_URL = base_url + f"&created_after={today}"
+if args.replay:
+    # --- Replay Raw Pages from Archive ---
+    records_of = lambda page: page
+    key_of = lambda mr: mr.get("id")
+    try:
+        if args.replay == "all":
+            data = raw_archive.load_latest_records(ARCHIVE_SOURCE, records_of, key_of)
+        else:
+            latest = raw_archive.latest_run_id(ARCHIVE_SOURCE)
+            run_id = latest if args.replay == "latest" else args.replay
+            data = [record for page in raw_archive.load_run(ARCHIVE_SOURCE, run_id) for record in records_of(page)]
+            if run_id != latest:
+                # Saving keeps the last row per key, so an older run would overwrite newer sheet rows
+                print(f"{Fore.YELLOW}⚠️ Run {run_id} is not the latest run ({latest}). "
+                      f"Its older data will overwrite newer rows in the sheet.{Style.RESET_ALL}")
+                if input("Continue anyway? (y/n): ").strip().lower() != "y":
+                    exit()
+    except (FileNotFoundError, KeyError) as e:
+        print(f"{Fore.RED}❌ Cannot replay: {e}{Style.RESET_ALL}")
+        exit(1)
+    logging.info(f"Replayed {len(data)} merge requests from archive run {args.replay}")
+    print(f"{Fore.YELLOW}\n🔁 Replaying {len(data)} merge requests from archive ({args.replay}).\n{Style.RESET_ALL}")
 else:
-    API_URL = base_url
+    # --- Ask user for filter option ---
+    print(f"{Fore.GREEN}Select Merge Request filter:{Style.RESET_ALL}")
+    print("1. All Merge Requests")
+    print("2. Only Open")
+    print("3. This Month")
+    print("4. This Week")
+    print("5. Today")
+    choice = input("Enter option (1-5): ").strip()
+
+    print(f"{Fore.YELLOW}\n🔧 Selected filter: {choice}\n{Style.RESET_ALL}")
+
+    # Validate choice
+    if choice not in ["1", "2", "3", "4", "5"]:
+        print(f"{Fore.RED}\n❌ Invalid choice. Defaulting to 'Only Open'.\n{Style.RESET_ALL}")
+        choice = "2"
+
+    base_url = "https://gitlab.com/api/v4/merge_requests?scope=created_by_me&per_page=100"
+    now = datetime.now()
+    if choice == "2":
+        API_URL = base_url + "&state=opened"
+    elif choice == "3":
+        first_day = now.replace(day=1).strftime("%Y-%m-%dT00:00:00Z")
+        API_URL = base_url + f"&created_after={first_day}"
+    elif choice == "4":
+        start_of_week = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%dT00:00:00Z")
+        API_URL = base_url + f"&created_after={start_of_week}"
+    elif choice == "5":
+        today = now.strftime("%Y-%m-%dT00:00:00Z")
+        API_URL = base_url + f"&created_after={today}"
+    else:
+        API_URL = base_url
 
-# --- Step 1: Safely Fetch from GitLab ---
-data = []
-page = 1
-while True:
+    # --- Step 1: Safely Fetch from GitLab ---
+    pages = []
+    data = []
+    page = 1
+    while True:
+        try:
+            headers = {
+                "Private-Token": ACCESS_TOKEN,
+                "Content-Type": "application/json"
+            }
+            response = requests.get(f"{API_URL}&page={page}", headers=headers, timeout=15)
+            response.raise_for_status()
+            page_data = response.json()
+            if not page_data:
+                break
+            pages.append(page_data)
+            data.extend(page_data)
+            if len(page_data) < 100:
+                break
+            page += 1
+        except requests.exceptions.HTTPError as errh:
+            print(f"⚠️ HTTP error: {errh}")
+            break
+        except requests.exceptions.ConnectionError as errc:
+            print(f"⚠️ Connection error: {errc}")
+            break
+        except requests.exceptions.Timeout as errt:
+            print(f"⚠️ Timeout error: {errt}")
+            break
+        except requests.exceptions.RequestException as err:
+            print(f"⚠️ Unexpected error: {err}")
+            break
+
+    # --- Archive Raw Pages ---
     try:
-        headers = {
-            "Private-Token": ACCESS_TOKEN,
-            "Content-Type": "application/json"
-        }
-        response = requests.get(f"{API_URL}&page={page}", headers=headers, timeout=15)
+        raw_archive.append_run(
+            ARCHIVE_SOURCE, raw_archive.new_run_id(), pages,
+            records_of=lambda page: page,
+            key_of=lambda mr: mr.get("id"),
+            meta={"url": API_URL},
+        )
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not archive raw merge request pages: {e}")
+
+# --- Step 1b: Enrich with Commit and Diff Stats (cached per MR) ---
+def load_enrichment_cache(path):
+    """Load cached MR enrichment keyed by 'project_id:iid', or an empty cache."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read enrichment cache '{path}': {e}")
+        return {}
+
+
+def save_enrichment_cache(path, cache):
+    """Write the enrichment cache atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
+
+def fetch_mr_stats(session, project_id, iid):
+    """Fetch commit count, first commit time and diff stats for one MR."""
+    mr_url = f"{GITLAB_API}/projects/{project_id}/merge_requests/{iid}"
+    commits = []
+    page = 1
+    while True:
+        response = session.get(f"{mr_url}/commits", params={"per_page": 100, "page": page}, timeout=15)
         response.raise_for_status()
         page_data = response.json()
-        if not page_data:
+        commits.extend(page_data)
+        if len(page_data) < 100:
             break
-        data.extend(page_data)
+        page += 1
+
+    # /diffs is paginated, so unlike /changes the file list is never capped
+    changes = []
+    page = 1
+    while True:
+        response = session.get(f"{mr_url}/diffs", params={"per_page": 100, "page": page}, timeout=30)
+        response.raise_for_status()
+        page_data = response.json()
+        changes.extend(page_data)
         if len(page_data) < 100:
             break
         page += 1
-    except requests.exceptions.HTTPError as errh:
-        print(f"⚠️ HTTP error: {errh}")
-        break
-    except requests.exceptions.ConnectionError as errc:
-        print(f"⚠️ Connection error: {errc}")
-        break
-    except requests.exceptions.Timeout as errt:
-        print(f"⚠️ Timeout error: {errt}")
-        break
-    except requests.exceptions.RequestException as err:
-        print(f"⚠️ Unexpected error: {err}")
-        break
+    # Individual files can still come back without diff text when GitLab marks them too large
+    diff_complete = not any(c.get("too_large") or (c.get("collapsed") and not c.get("diff")) for c in changes)
+    additions = deletions = 0
+    for change in changes:
+        # GitLab diffs start at the first hunk, so there are no ---/+++ file headers
+        for line in (change.get("diff") or "").splitlines():
+            if line.startswith("+"):
+                additions += 1
+            elif line.startswith("-"):
+                deletions += 1
+
+    # authored_date survives rebase/amend/squash (created_at is the committer date);
+    # timestamps carry the author's UTC offset, so compare them as instants
+    commit_times = pd.to_datetime([c.get("authored_date") for c in commits if c.get("authored_date")], utc=True)
+    return {
+        "commits": len(commits),
+        "additions": additions,
+        "deletions": deletions,
+        "files_changed": len(changes),
+        "first_commit_at": commit_times.min().isoformat() if len(commit_times) else None,
+        "diff_complete": diff_complete,
+    }
+
+
+enrichment = load_enrichment_cache(ENRICH_CACHE_PATH)
+
+
+def enrichment_key(mr):
+    return f"{mr.get('project_id')}:{mr.get('iid')}"
+
+
+if not args.skip_enrichment:
+    # Only MRs whose updated_at moved are refetched. Merged MRs with complete
+    # stats are final; incomplete ones are kept as-is until the MR changes again.
+    stale = [
+        mr for mr in data
+        if enrichment_key(mr) not in enrichment
+        or (enrichment[enrichment_key(mr)].get("updated_at") != mr.get("updated_at")
+            and not (enrichment[enrichment_key(mr)].get("state") == "merged"
+                     and enrichment[enrichment_key(mr)].get("diff_complete")))
+    ]
+    logging.info(f"Enrichment: {len(stale)} changed merge requests, {len(data) - len(stale)} served from cache.")
+
+    if stale and args.replay:
+        print(f"{Fore.YELLOW}🔁 Replay mode: skipping enrichment fetch for {len(stale)} changed merge requests.{Style.RESET_ALL}")
+    elif stale:
+        print(f"{Fore.YELLOW}🔧 Enriching {len(stale)} changed merge requests…{Style.RESET_ALL}")
+        failed = 0
+        with requests.Session() as session:
+            session.headers.update({"Private-Token": ACCESS_TOKEN})
+            adapter = requests.adapters.HTTPAdapter(pool_connections=ENRICH_WORKERS, pool_maxsize=ENRICH_WORKERS)
+            session.mount("https://", adapter)
+            with ThreadPoolExecutor(max_workers=ENRICH_WORKERS) as pool:
+                futures = {pool.submit(fetch_mr_stats, session, mr.get("project_id"), mr.get("iid")): mr for mr in stale}
+                for future in as_completed(futures):
+                    mr = futures[future]
+                    try:
+                        stats = future.result()
+                    except Exception as e:
+                        # One bad MR must not lose the rest; leave its cache entry stale so it is retried next run
+                        failed += 1
+                        logging.error(f"Error enriching MR {enrichment_key(mr)}: {e}")
+                        continue
+                    stats.update({"updated_at": mr.get("updated_at"), "state": mr.get("state")})
+                    if not stats["diff_complete"]:
+                        logging.warning(f"Diff stats for MR {enrichment_key(mr)} are incomplete; they will be fetched again when the MR is updated.")
+                    enrichment[enrichment_key(mr)] = stats
+        if failed:
+            print(f"{Fore.YELLOW}⚠️ Could not enrich {failed} merge requests. See log for details.{Style.RESET_ALL}")
+        try:
+            save_enrichment_cache(ENRICH_CACHE_PATH, enrichment)
+        except OSError as e:
+            logging.warning(f"Could not save enrichment cache: {e}")
 
 # --- Step 2: Flatten and Add Timestamp ---
 flat_data = []
@@ -116,6 +300,7 @@ projects = {
 }
 
 for mr in data:
+    stats = enrichment.get(enrichment_key(mr), {})
     flat_data.append({
         "ID": mr.get("id"),
         "MR Number": mr.get("iid"),
@@ -134,6 +319,12 @@ for mr in data:
         "Reviewers": ", ".join([r.get("name") for r in mr.get("reviewers", [])]),
         "Web URL": mr.get("web_url"),
         "Description": mr.get("description"),
+        "Commits": stats.get("commits"),
+        "Additions": stats.get("additions"),
+        "Deletions": stats.get("deletions"),
+        "Files Changed": stats.get("files_changed"),
+        "First Commit At": stats.get("first_commit_at"),
+        "Diff Stats Complete": stats.get("diff_complete"),
         "Logged At": timestamp
     })
 
@@ -142,63 +333,58 @@ logging.info(f"[{timestamp}] {len(flat_data)} merge requests fetched.")
 print(f"{Fore.GREEN}\n\n✅ Success:{Style.RESET_ALL} {len(flat_data)} merge requests fetched.\n\n")
 
 # --- Load JIRA Tickets sheet for lookup ---
-def get_jira_details(jira_keys, jira_excel_path, jira_sheet_name="JIRA Tickets"):
-    """Fetch Summaries and Descriptions from JIRA Tickets sheet by multiple Keys."""
-    if not jira_keys or not os.path.exists(jira_excel_path):
-        return "", ""
+def load_jira_lookup(jira_excel_path, jira_sheet_name="JIRA Tickets"):
+    """Read the JIRA Tickets sheet once and return {Key: {Summary, Description}}."""
+    if not jira_excel_path or not os.path.exists(jira_excel_path):
+        return {}
     try:
-        jira_df = pd.read_excel(jira_excel_path, sheet_name=jira_sheet_name)
-        summaries = []
-        descriptions = []
-        for key in [k.strip() for k in jira_keys.split(";") if k.strip()]:
-            match = jira_df[jira_df["Key"] == key]
-            if not match.empty:
-                summary = match.iloc[0].get("Summary", "")
-                description = match.iloc[0].get("Description", "")
-                # Replace NaN with empty string
-                if pd.isna(summary):
-                    summary = ""
-                if pd.isna(description):
-                    description = ""
-                summaries.append(str(summary))
-                descriptions.append(str(description))
-        return " | ".join(summaries) if summaries else "None", " | ".join(descriptions) if descriptions else "None"
+        jira_df = pd.read_excel(jira_excel_path, sheet_name=jira_sheet_name, usecols=["Key", "Summary", "Description"])
+        jira_df = jira_df.drop_duplicates(subset="Key").fillna("").astype(str)
+        return jira_df.set_index("Key").to_dict("index")
     except Exception as e:
-        print(f"{Fore.YELLOW}⚠️ Could not fetch JIRA details for {jira_keys}: {e}{Style.RESET_ALL}")
-    return "None", "None"
+        print(f"{Fore.YELLOW}⚠️ Could not load JIRA details: {e}{Style.RESET_ALL}")
+    return {}
+
+def get_jira_details(jira_keys, jira_lookup):
+    """Fetch Summaries and Descriptions for multiple Keys from the lookup."""
+    if not jira_keys:
+        return "", ""
+    matches = [jira_lookup[k] for k in (k.strip() for k in jira_keys.split(";")) if k in jira_lookup]
+    if not matches:
+        return "None", "None"
+    return " | ".join(m["Summary"] for m in matches), " | ".join(m["Description"] for m in matches)
 
 # Show table summary in console
 if flat_data:
-    print("\n🗂️  Merge Request Summary:\n")
-    for idx, mr in enumerate(flat_data, 1):
-        jira_keys = mr.get("JIRA Ticket", "")
-        jira_summary, jira_description = get_jira_details(jira_keys, EXCEL_PATH)
-        details = {
-            "JIRA Ticket":  jira_keys if jira_keys else "N/A",
-            "Repo Name":  mr.get("Project Name", "N/A"),
-            "Title": mr.get("Title", "N/A"),
-            "Source Branch": mr.get("Source Branch", "N/A"),
-            "Target Branch": mr.get("Target Branch", "N/A"),
-            "Created At": mr.get("Created At", "N/A"),
-            "MR Link": mr.get("Web URL", "N/A"),
-            "MRDescription": mr.get("Description", "N/A"),
-            "JIRA Summary": jira_summary,
-            "JIRA Description": jira_description,
-        }
-        # Choose emoji based on MR state
-        state_emoji = {
-            "opened": "🟢",
-            "merged": "🟣",
-            "closed": "🔴",
-            "locked": "🔒"
-        }
-        mr_state = mr.get("State", "").lower()
-        emoji = state_emoji.get(mr_state, "🔹")
-        print(f"{Fore.CYAN}{emoji} Merge Request #{mr.get('MR Number', 'N/A')} for Ticket {jira_keys} [{mr_state.capitalize() if mr_state else 'N/A'}]{Style.RESET_ALL}")
-        print(tabulate(details.items(), tablefmt="plain"))
-        print("-" * 60)
-
-        # logging.info(f"[{timestamp}] Project Name: {mr.get('Project Name', 'N/A')} - Merge Request #{mr.get('MR Number', 'N/A')} for JIRA Ticket {jira_keys} - {mr.get('Title', 'N/A')}")
+    summary_df = pd.DataFrame(flat_data)
+    if not args.quiet:
+        jira_lookup = load_jira_lookup(EXCEL_PATH)
+        jira_details = summary_df["JIRA Ticket"].map(lambda keys: get_jira_details(keys, jira_lookup))
+        summary_df["JIRA Summary"] = jira_details.str[0]
+        summary_df["JIRA Description"] = jira_details.str[1]
+
+    # Choose emoji based on MR state
+    state_emoji = {
+        "opened": "🟢",
+        "merged": "🟣",
+        "closed": "🔴",
+        "locked": "🔒"
+    }
+    mr_state = summary_df["State"].fillna("").str.lower()
+    state_label = mr_state.str.capitalize().replace("", "N/A")
+    mr_headers = (
+        f"{Fore.CYAN}" + mr_state.map(state_emoji).fillna("🔹")
+        + " Merge Request #" + summary_df["MR Number"].astype(str)
+        + " for Ticket " + summary_df["JIRA Ticket"] + " [" + state_label + f"]{Style.RESET_ALL}"
+    )
+
+    summary_df["JIRA Ticket"] = summary_df["JIRA Ticket"].replace("", "N/A")
+    summary_df = summary_df.rename(columns={"Project Name": "Repo Name", "Web URL": "MR Link", "Description": "MRDescription"})
+    display_cols = ["JIRA Ticket", "Repo Name", "Title", "Source Branch", "Target Branch", "Created At",
+                    "MR Link", "MRDescription", "JIRA Summary", "JIRA Description"]
+    if args.summary:
+        display_cols = ["MR Number", "State", "JIRA Ticket", "Repo Name", "Title", "Created At"]
+    console_renderer.render(summary_df, display_cols, mr_headers, "🗂️  Merge Request Summary:", args)
 else:
     print("😶 No open merge requests found for this user.")
     exit()
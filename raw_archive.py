@@ -0,0 +1,137 @@
+import gzip
+import json
+import os
+from datetime import datetime
+
+# --- Config ---
+ARCHIVE_DIR = "./archive"
+
+
+def _archive_path(source):
+    return os.path.join(ARCHIVE_DIR, f"{source}_raw.jsonl.gz")
+
+
+def _index_path(source):
+    return os.path.join(ARCHIVE_DIR, f"{source}_index.json")
+
+
+def new_run_id():
+    """Return a run identifier based on the current time (microsecond resolution)."""
+    return datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+
+def load_index(source):
+    """Load the run/key index for a source, or an empty index if none exists."""
+    path = _index_path(source)
+    if not os.path.exists(path):
+        return {"runs": {}, "keys": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_index(source, index):
+    path = _index_path(source)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+def append_run(source, run_id, pages, records_of, key_of, meta=None):
+    """Append one run's raw pages to the compressed archive.
+
+    Each run is written as a single gzip member appended to the end of the
+    archive, so earlier runs are never rewritten. The index records the byte
+    offset/length of every run and which runs contained each key.
+    records_of(page) yields the records of a page and key_of(record) their key.
+    """
+    if not pages:
+        return
+    index = load_index(source)
+    if run_id in index["runs"]:
+        raise ValueError(f"Run '{run_id}' already exists in '{source}' archive.")
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    lines = []
+    run_keys = []
+    for page_no, page in enumerate(pages, 1):
+        lines.append(json.dumps({"run": run_id, "page": page_no, "payload": page}))
+        run_keys.extend(key_of(record) for record in records_of(page))
+    blob = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+
+    with open(_archive_path(source), "ab") as f:
+        offset = f.tell()
+        f.write(blob)
+
+    index["runs"][run_id] = {
+        "offset": offset,
+        "length": len(blob),
+        "pages": len(pages),
+        "records": len(run_keys),
+        "archived_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "meta": meta or {},
+    }
+    for key in run_keys:
+        runs = index["keys"].setdefault(str(key), [])
+        if run_id not in runs:
+            runs.append(run_id)
+    _save_index(source, index)
+
+
+def list_runs(source):
+    """Return the archived run ids for a source, oldest first."""
+    return sorted(load_index(source)["runs"])
+
+
+def latest_run_id(source):
+    """Return the id of the most recent archived run, or None if there is none."""
+    runs = load_index(source)["runs"]
+    return max(runs) if runs else None
+
+
+def _read_run(source, entry):
+    with open(_archive_path(source), "rb") as f:
+        f.seek(entry["offset"])
+        blob = f.read(entry["length"])
+    pages = []
+    for line in gzip.decompress(blob).decode("utf-8").splitlines():
+        if line:
+            pages.append(json.loads(line)["payload"])
+    return pages
+
+
+def load_run(source, run_id=None):
+    """Return the raw pages of an archived run (latest run if run_id is None)."""
+    index = load_index(source)
+    if not index["runs"]:
+        raise FileNotFoundError(f"No archived runs found for '{source}'.")
+    if run_id is None:
+        run_id = max(index["runs"])
+    if run_id not in index["runs"]:
+        raise KeyError(f"Run '{run_id}' not found in '{source}' archive.")
+    return _read_run(source, index["runs"][run_id])
+
+
+def load_latest_records(source, records_of, key_of):
+    """Return the newest archived record for every key across all runs.
+
+    The key index picks the most recent run for each key, so each needed run
+    is decompressed once and only records that are current are returned.
+    """
+    index = load_index(source)
+    if not index["runs"]:
+        raise FileNotFoundError(f"No archived runs found for '{source}'.")
+    keys_by_run = {}
+    for key, runs in index["keys"].items():
+        keys_by_run.setdefault(max(runs), set()).add(key)
+
+    records = []
+    for run_id in sorted(keys_by_run):
+        wanted = keys_by_run[run_id]
+        for page in _read_run(source, index["runs"][run_id]):
+            for record in records_of(page):
+                key = str(key_of(record))
+                if key in wanted:
+                    records.append(record)
+                    # A key appears once per run; ignore any later duplicate
+                    wanted.discard(key)
+    return records